@@ -0,0 +1,451 @@
+"""
+Load generator for /api/analyze.
+
+Replays recorded or synthetic `roofs` payloads (ECEF coordinate arrays, as
+welcome.html posts them) against a backend at a fixed concurrency and,
+optionally, a Poisson arrival rate. Reports throughput, latency
+percentiles, error rate and server RSS over time, and writes a JSON report
+that can be compared against a previous run.
+
+With --verify, every successful analysis is checked for its own output: the
+GLB it names must be unique across the run and must be served by
+/backend/static. A repeated or missing file means concurrent requests
+interfered with each other.
+
+--start-server runs the backend against a throwaway database and static
+directory, removed when the run ends, so load runs never touch real
+analyses or their GLBs. Payloads are drawn from --seed in request order,
+so two runs with the same seed send the same sequence.
+
+Uses only the standard library so it can run outside the server venv
+(--binary additionally imports roofcodec, which needs NumPy).
+
+Examples:
+    python loadtest.py --start-server --concurrency 8 --duration 60
+    python loadtest.py --payloads recorded.jsonl --rate 5 --out run.json
+    python loadtest.py --start-server --verify --compare baseline.json
+    python loadtest.py --start-server --binary --out binary.json
+"""
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# WGS84 ellipsoid
+WGS84_A = 6378137.0
+WGS84_E2 = 6.69437999014e-3
+
+# --------------------------
+# Payloads
+# --------------------------
+def geodetic_to_ecef(lat, lon, h=0.0):
+    lat, lon = math.radians(lat), math.radians(lon)
+    n = WGS84_A / math.sqrt(1 - WGS84_E2 * math.sin(lat) ** 2)
+    x = (n + h) * math.cos(lat) * math.cos(lon)
+    y = (n + h) * math.cos(lat) * math.sin(lon)
+    z = (n * (1 - WGS84_E2) + h) * math.sin(lat)
+    return x, y, z
+
+def enu_to_ecef(lat, lon, origin, e, n, u):
+    lat, lon = math.radians(lat), math.radians(lon)
+    sl, cl = math.sin(lat), math.cos(lat)
+    so, co = math.sin(lon), math.cos(lon)
+    x = -so * e - sl * co * n + cl * co * u
+    y = co * e - sl * so * n + cl * so * u
+    z = cl * n + sl * u
+    return [origin[0] + x, origin[1] + y, origin[2] + z]
+
+def synthetic_payload(rng, lat=13.1459, lon=100.9471, buildings=1):
+    """
+    Gable-roof buildings near (lat, lon): two planes per building sharing a
+    ridge, with randomised footprint, pitch and heading.
+    """
+    roofs = []
+    for _ in range(buildings):
+        blat = lat + rng.uniform(-0.002, 0.002)
+        blon = lon + rng.uniform(-0.002, 0.002)
+        origin = geodetic_to_ecef(blat, blon, rng.uniform(0, 30))
+        length = rng.uniform(6, 20)
+        half_width = rng.uniform(3, 6)
+        ridge = half_width * math.tan(math.radians(rng.uniform(10, 40)))
+        heading = math.radians(rng.uniform(0, 360))
+        ch, sh = math.cos(heading), math.sin(heading)
+
+        def point(x, y, z):
+            return enu_to_ecef(blat, blon, origin, x * ch - y * sh, x * sh + y * ch, z)
+
+        roofs.append([point(0, 0, ridge), point(length, 0, ridge),
+                      point(length, half_width, 0), point(0, half_width, 0)])
+        roofs.append([point(0, -half_width, 0), point(length, -half_width, 0),
+                      point(length, 0, ridge), point(0, 0, ridge)])
+    return {"roofs": roofs}
+
+def load_payloads(path):
+    """Read payloads from a .jsonl file, or a .json file holding one payload or a list."""
+    with open(path, "r") as f:
+        if path.endswith(".jsonl"):
+            payloads = [json.loads(line) for line in f if line.strip()]
+        else:
+            data = json.load(f)
+            payloads = data if isinstance(data, list) else [data]
+    payloads = [p for p in payloads if p.get("roofs")]
+    if not payloads:
+        raise ValueError(f"No payloads with roofs in {path}")
+    return payloads
+
+# --------------------------
+# Server process
+# --------------------------
+def start_server(port, data_dir):
+    """Launch server.py with its analysis store and GLBs under data_dir."""
+    env = dict(
+        os.environ, PORT=str(port),
+        ANALYSES_DB=os.path.join(data_dir, "analyses.db"),
+        STATIC_DIR=os.path.join(data_dir, "static"),
+    )
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(BASE_DIR, "server.py")],
+        cwd=BASE_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f"http://127.0.0.1:{port}/health"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server exited with code {proc.returncode}")
+        try:
+            with urllib.request.urlopen(url, timeout=1):
+                return proc
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("Server did not become healthy within 30s")
+
+def read_rss_mb(pid):
+    """Resident set size of a process in MiB (Linux /proc), or None."""
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+# --------------------------
+# Load generation
+# --------------------------
+class Recorder:
+    """Thread-safe sink for request outcomes."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.errors = 0
+        self.inconsistent = 0
+        self.status_counts = {}
+
+    def record(self, latency, status, ok, consistent=True):
+        with self.lock:
+            if ok:
+                self.latencies.append(latency)
+            else:
+                self.errors += 1
+            if not consistent:
+                self.inconsistent += 1
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+
+    def snapshot(self):
+        with self.lock:
+            return len(self.latencies), self.errors
+
+def encode_requests(payloads, binary=False):
+    """
+    Pre-encode payloads as (query string, body, content type) so encoding
+    cost stays out of the measured latency.
+    """
+    if not binary:
+        return [("", json.dumps(p).encode(), "application/json") for p in payloads]
+
+    from roofcodec import ROOFS_MIME, encode_roofs
+    encoded = []
+    for p in payloads:
+        params = p.get("params") or {}
+        query = "?" + urllib.parse.urlencode(params) if params else ""
+        encoded.append((query, encode_roofs(p["roofs"]), ROOFS_MIME))
+    return encoded
+
+def send(url, body, content_type, timeout):
+    """POST one payload. Returns (status, response JSON or None)."""
+    req = urllib.request.Request(url, data=body, headers={"Content-Type": content_type})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        return e.code, None
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        return type(e).__name__, None
+
+def model_file_exists(base_url, model_file, timeout):
+    """True if the GLB this request produced is served by the backend."""
+    if not model_file:
+        return False
+    req = urllib.request.Request(f"{base_url}/backend/static/{model_file}", method="HEAD")
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status == 200
+    except (urllib.error.URLError, OSError, ValueError):
+        return False
+
+def run_load(base_url, bodies, recorder, concurrency, duration, rate, max_requests, timeout, rng,
+             verify=False):
+    """
+    Closed loop (rate=None): `concurrency` workers send back to back.
+    Open loop: Poisson arrivals at `rate`/s served by `concurrency` workers;
+    latency is measured from the scheduled arrival so queueing counts.
+    """
+    url = f"{base_url}/api/analyze"
+    deadline = time.monotonic() + duration
+    issued = [0]
+    issued_lock = threading.Lock()
+    seen_files = set()
+    seen_lock = threading.Lock()
+
+    def claim():
+        """Next request's payload index, drawn in issue order so runs with one seed match."""
+        with issued_lock:
+            if max_requests and issued[0] >= max_requests:
+                return None
+            issued[0] += 1
+            return rng.randrange(len(bodies))
+
+    def verify_result(data):
+        model_file = data.get("file")
+        with seen_lock:
+            unique = model_file not in seen_files
+            seen_files.add(model_file)
+        return unique and model_file_exists(base_url, model_file, timeout)
+
+    def one(scheduled, index):
+        query, body, content_type = bodies[index]
+        status, data = send(url + query, body, content_type, timeout)
+        latency = time.monotonic() - scheduled
+        ok = bool(data and data.get("success"))
+        consistent = True
+        if ok and verify:
+            consistent = verify_result(data)
+        recorder.record(latency, status, ok, consistent)
+
+    if rate is None:
+        def worker():
+            while time.monotonic() < deadline:
+                index = claim()
+                if index is None:
+                    return
+                one(time.monotonic(), index)
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        next_arrival = time.monotonic()
+        while next_arrival < deadline:
+            index = claim()
+            if index is None:
+                break
+            delay = next_arrival - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(one, next_arrival, index)
+            next_arrival += rng.expovariate(rate)
+
+def sample_timeline(recorder, pid, interval, stop, timeline):
+    start = time.monotonic()
+    last_ok, last_err = 0, 0
+    while not stop.wait(interval):
+        ok, err = recorder.snapshot()
+        rss = read_rss_mb(pid) if pid else None
+        timeline.append({
+            "t": round(time.monotonic() - start, 2),
+            "completed": ok - last_ok,
+            "errors": err - last_err,
+            "rss_mb": round(rss, 1) if rss is not None else None,
+        })
+        last_ok, last_err = ok, err
+
+# --------------------------
+# Reporting
+# --------------------------
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    k = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[k]
+
+def summarize(recorder, elapsed, timeline):
+    lat = sorted(recorder.latencies)
+    total = len(lat) + recorder.errors
+    rss = [s["rss_mb"] for s in timeline if s["rss_mb"] is not None]
+
+    def ms(v):
+        return round(v * 1000, 1) if v is not None else None
+
+    return {
+        "requests": total,
+        "succeeded": len(lat),
+        "errors": recorder.errors,
+        "error_rate": round(recorder.errors / total, 4) if total else 0.0,
+        "inconsistent": recorder.inconsistent,
+        "throughput_rps": round(len(lat) / elapsed, 3) if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "p50": ms(percentile(lat, 50)),
+            "p95": ms(percentile(lat, 95)),
+            "p99": ms(percentile(lat, 99)),
+            "max": ms(lat[-1] if lat else None),
+        },
+        "rss_mb": {
+            "start": rss[0] if rss else None,
+            "peak": max(rss) if rss else None,
+            "end": rss[-1] if rss else None,
+        },
+        "status_counts": {str(k): v for k, v in recorder.status_counts.items()},
+    }
+
+def print_summary(summary, baseline=None):
+    def row(label, path, fmt="{}"):
+        value = summary
+        base = baseline
+        for key in path:
+            value = value.get(key) if value else None
+            base = base.get(key) if base else None
+        line = f"  {label:<16}{fmt.format(value) if value is not None else '-'}"
+        if isinstance(value, (int, float)) and isinstance(base, (int, float)) and base:
+            line += f"   (baseline {fmt.format(base)}, {100 * (value - base) / base:+.1f}%)"
+        print(line)
+
+    print("\nResults")
+    row("requests", ["requests"])
+    row("error rate", ["error_rate"], "{:.2%}")
+    row("inconsistent", ["inconsistent"])
+    row("throughput", ["throughput_rps"], "{:.2f} req/s")
+    row("p50", ["latency_ms", "p50"], "{:.1f} ms")
+    row("p95", ["latency_ms", "p95"], "{:.1f} ms")
+    row("p99", ["latency_ms", "p99"], "{:.1f} ms")
+    row("peak RSS", ["rss_mb", "peak"], "{:.1f} MiB")
+    if summary["status_counts"]:
+        print(f"  {'statuses':<16}{summary['status_counts']}")
+
+# --------------------------
+# Main
+# --------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="backend base URL")
+    parser.add_argument("--start-server", action="store_true",
+                        help="launch server.py locally for the run, with a scratch store")
+    parser.add_argument("--port", type=int, default=8765, help="port for --start-server")
+    parser.add_argument("--server-pid", type=int, help="pid of an already running server, for RSS sampling")
+    parser.add_argument("--payloads", help="recorded payloads (.json or .jsonl); synthetic if omitted")
+    parser.add_argument("--synthetic", type=int, default=20, help="number of distinct synthetic payloads")
+    parser.add_argument("--buildings", type=int, default=1, help="buildings per synthetic payload")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rate", type=float, help="open-loop arrival rate in req/s (closed loop if omitted)")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--requests", type=int, help="stop after this many requests")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request timeout in seconds")
+    parser.add_argument("--interval", type=float, default=1.0, help="timeline sample interval in seconds")
+    parser.add_argument("--verify", action="store_true", help="check each analysis produced its own, servable GLB")
+    parser.add_argument("--binary", action="store_true", help="send application/x-roofs instead of JSON")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--compare", help="previous JSON report to compare against")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    if args.payloads:
+        payloads = load_payloads(args.payloads)
+    else:
+        payloads = [synthetic_payload(rng, buildings=args.buildings) for _ in range(args.synthetic)]
+    bodies = encode_requests(payloads, binary=args.binary)
+
+    proc = None
+    data_dir = None
+    base_url = args.url
+    pid = args.server_pid
+    if args.start_server:
+        data_dir = tempfile.mkdtemp(prefix="roof-loadtest-")
+        try:
+            proc = start_server(args.port, data_dir)
+        except RuntimeError:
+            shutil.rmtree(data_dir, ignore_errors=True)
+            raise
+        base_url = f"http://127.0.0.1:{args.port}"
+        pid = proc.pid
+
+    config = {
+        "url": base_url,
+        "payloads": args.payloads or f"synthetic x{len(payloads)} ({args.buildings} building(s))",
+        "concurrency": args.concurrency,
+        "rate": args.rate,
+        "duration": args.duration,
+        "requests": args.requests,
+        "verify": args.verify,
+        "binary": args.binary,
+        "seed": args.seed,
+    }
+    print(f"Load test: {json.dumps(config)}")
+
+    recorder = Recorder()
+    timeline = []
+    stop = threading.Event()
+    sampler = threading.Thread(
+        target=sample_timeline, args=(recorder, pid, args.interval, stop, timeline), daemon=True
+    )
+    try:
+        sampler.start()
+        started = time.monotonic()
+        run_load(base_url, bodies, recorder, args.concurrency, args.duration,
+                 args.rate, args.requests, args.timeout, rng, verify=args.verify)
+        elapsed = time.monotonic() - started
+    finally:
+        stop.set()
+        sampler.join()
+        if proc:
+            proc.terminate()
+            proc.wait(timeout=10)
+        if data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    summary = summarize(recorder, elapsed, timeline)
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f).get("summary")
+    print_summary(summary, baseline)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"config": config, "summary": summary, "timeline": timeline}, f, indent=2)
+        print(f"\nReport written to {args.out}")
+    return 1 if summary["errors"] or summary["inconsistent"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
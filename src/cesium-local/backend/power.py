@@ -0,0 +1,122 @@
+"""
+PV power conversion stage.
+
+Takes hourly plane-of-array irradiance from solar.poa_matrix and converts it
+to AC energy: SAPM cell temperature, PVWatts DC with a module temperature
+coefficient, then planes are summed onto inverters and passed through the
+PVWatts inverter efficiency curve, which clips at the AC rating.
+
+Every step operates on planes x hours (or inverters x hours) arrays, so one
+building or a batch of buildings at the same location is a single pass.
+"""
+import numpy as np
+import pvlib
+
+from solar import plane_orientation, poa_matrix
+
+MODULE_EFFICIENCY = 0.20      # STC efficiency, W per W/m² of panel area
+GAMMA_PDC = -0.0035           # 1/°C, typical crystalline silicon
+DC_LOSS = 0.14                # soiling, wiring, mismatch (PVWatts default)
+DC_AC_RATIO = 1.2
+ETA_INV_NOM = 0.96
+TEMPERATURE_MODEL = "close_mount_glass_glass"  # roof-mounted
+
+def plane_capacity_w(roofs, module_efficiency=MODULE_EFFICIENCY):
+    """STC DC rating (W) of each plane's usable panel area."""
+    area = np.array([roof.get("panel_area") or 0.0 for roof in roofs], dtype=float)
+    return area * module_efficiency * 1000.0
+
+def simulate_power(sky, buildings, inverter_maps=None,
+                   module_efficiency=MODULE_EFFICIENCY, gamma_pdc=GAMMA_PDC,
+                   dc_loss=DC_LOSS, dc_ac_ratio=DC_AC_RATIO, eta_inv_nom=ETA_INV_NOM,
+                   temperature_model=TEMPERATURE_MODEL):
+    """
+    Hourly power for a batch of buildings sharing one sky.
+
+    buildings: list of roof_infos lists (one per building).
+    inverter_maps: optional list (per building) of per-plane inverter
+        numbers local to that building, using every number in 0..k-1;
+        default is one inverter per building.
+        Each inverter is sized at its DC capacity / dc_ac_ratio.
+
+    Returns a dict of arrays:
+        poa_w and dc_w (planes x hours), ac_w (inverters x hours),
+        building_ac_kwh (buildings x hours), capacity_w (planes),
+        ac_rating_w and clipped_hours (inverters),
+        plane_building (planes), inverter_building (inverters).
+    """
+    roofs, plane_building, plane_inverter = [], [], []
+    inverter_building = []
+    for b, building in enumerate(buildings):
+        local = list(inverter_maps[b]) if inverter_maps and inverter_maps[b] is not None else [0] * len(building)
+        if len(local) != len(building):
+            raise ValueError(f"Building {b}: inverter map has {len(local)} entries for {len(building)} planes")
+        if any(i < 0 for i in local):
+            raise ValueError(f"Building {b}: inverter numbers must be non-negative")
+        n_local = max(local) + 1 if local else 0
+        if len(set(local)) != n_local:
+            unused = sorted(set(range(n_local)) - set(local))
+            raise ValueError(f"Building {b}: inverter numbers must run 0..{n_local - 1} without gaps (unused: {unused})")
+        base = len(inverter_building)
+        inverter_building.extend([b] * n_local)
+        roofs.extend(building)
+        plane_building.extend([b] * len(building))
+        plane_inverter.extend(base + i for i in local)
+
+    plane_building = np.array(plane_building, dtype=int)
+    plane_inverter = np.array(plane_inverter, dtype=int)
+    inverter_building = np.array(inverter_building, dtype=int)
+    hours = len(sky["epoch"])
+
+    if not roofs:
+        return {
+            "poa_w": np.zeros((0, hours)),
+            "dc_w": np.zeros((0, hours)),
+            "ac_w": np.zeros((len(inverter_building), hours)),
+            "building_ac_kwh": np.zeros((len(buildings), hours)),
+            "capacity_w": np.zeros(0),
+            "ac_rating_w": np.zeros(len(inverter_building)),
+            "clipped_hours": np.zeros(len(inverter_building), dtype=int),
+            "plane_building": plane_building,
+            "inverter_building": inverter_building,
+        }
+
+    orientation = np.array([plane_orientation(roof, sky["lat"]) for roof in roofs])
+    poa = poa_matrix(sky, orientation[:, 0], orientation[:, 1])
+
+    params = pvlib.temperature.TEMPERATURE_MODEL_PARAMETERS["sapm"][temperature_model]
+    temp_cell = pvlib.temperature.sapm_cell(poa, sky["temp_air"], sky["wind_speed"], **params)
+
+    capacity = plane_capacity_w(roofs, module_efficiency)
+    dc = pvlib.pvsystem.pvwatts_dc(poa, temp_cell, capacity[:, None], gamma_pdc)
+    dc = np.maximum(dc, 0.0) * (1 - dc_loss)
+
+    # planes -> inverters (and later inverters -> buildings) as matrix products
+    n_inv = len(inverter_building)
+    to_inverter = np.zeros((n_inv, len(roofs)))
+    to_inverter[plane_inverter, np.arange(len(roofs))] = 1.0
+    inverter_dc = to_inverter @ dc
+    inverter_capacity = to_inverter @ capacity
+
+    # PVWatts: pac0 = eta_inv_nom * pdc0, so size pdc0 from the AC rating
+    pac0 = inverter_capacity / dc_ac_ratio
+    pdc0 = np.where(pac0 > 0, pac0 / eta_inv_nom, 1.0)[:, None]
+    ac = pvlib.inverter.pvwatts(inverter_dc, pdc0, eta_inv_nom=eta_inv_nom)
+    ac = np.where(inverter_capacity[:, None] > 0, ac, 0.0)
+    clipped_hours = np.count_nonzero((ac >= pac0[:, None] - 1e-9) & (pac0[:, None] > 0), axis=1)
+
+    to_building = np.zeros((len(buildings), n_inv))
+    to_building[inverter_building, np.arange(n_inv)] = 1.0
+    building_ac_kwh = (to_building @ ac) / 1000  # hourly steps: W -> kWh
+
+    return {
+        "poa_w": poa,
+        "dc_w": dc,
+        "ac_w": ac,
+        "building_ac_kwh": building_ac_kwh,
+        "capacity_w": capacity,
+        "ac_rating_w": pac0,
+        "clipped_hours": clipped_hours,
+        "plane_building": plane_building,
+        "inverter_building": inverter_building,
+    }
@@ -0,0 +1,141 @@
+"""
+Binary encodings for /api/analyze.
+
+Request (application/x-roofs), little-endian:
+    b"ROOF", uint32 version, uint32 n_roofs, uint32 n_vertices,
+    uint32[n_roofs + 1] vertex offsets (first 0, last n_vertices),
+    zero padding to an 8-byte boundary,
+    float64[n_vertices * 3] ECEF x, y, z.
+
+decode_roofs returns per-roof (k, 3) views into the request buffer, so the
+coordinates are never copied or parsed.
+
+Response (application/x-roof-stats), little-endian:
+    b"RSTA", uint32 version, uint32 analysis_id, uint32 n_planes,
+    uint32 total_parts, uint32 snap points/clusters/merged, uint32 name_len,
+    model file name (utf-8), zero padding to an 8-byte boundary,
+    float64 lat, lon, height,
+    float32[n_planes, 7] index, tilt, azimuth, is_flat, panel width/height/area
+    (NaN where the JSON response has null).
+"""
+import math
+import struct
+import sys
+from array import array
+
+import numpy as np
+
+ROOFS_MIME = "application/x-roofs"
+STATS_MIME = "application/x-roof-stats"
+
+ROOFS_MAGIC = b"ROOF"
+STATS_MAGIC = b"RSTA"
+VERSION = 1
+
+ROOFS_HEADER = struct.Struct("<4sIII")
+STATS_HEADER = struct.Struct("<4sIIIIIIII")
+PLANE_FIELDS = ("index", "tilt", "azimuth", "is_flat", "panel_width", "panel_height", "panel_area")
+
+def _pad8(n):
+    return (-n) % 8
+
+# --------------------------
+# Roofs (request)
+# --------------------------
+def encode_roofs(roofs):
+    """Pack a list of roofs (each a list of [x, y, z]) into the request format."""
+    offsets = array("I", [0])
+    coords = array("d")
+    for roof in roofs:
+        for p in roof:
+            coords.extend(float(c) for c in p[:3])
+        offsets.append(len(coords) // 3)
+    head = ROOFS_HEADER.pack(ROOFS_MAGIC, VERSION, len(roofs), len(coords) // 3)
+    head += _le(offsets).tobytes()
+    return head + b"\0" * _pad8(len(head)) + _le(coords).tobytes()
+
+def decode_roofs(buf):
+    """
+    Decode the request format into a list of (k, 3) float64 arrays that
+    share memory with buf. Raises ValueError on malformed input.
+    """
+    if len(buf) < ROOFS_HEADER.size:
+        raise ValueError("Roof payload too short")
+    magic, version, n_roofs, n_vertices = ROOFS_HEADER.unpack_from(buf)
+    if magic != ROOFS_MAGIC or version != VERSION:
+        raise ValueError("Unsupported roof payload")
+
+    offsets_end = ROOFS_HEADER.size + 4 * (n_roofs + 1)
+    coords_start = offsets_end + _pad8(offsets_end)
+    if len(buf) != coords_start + 24 * n_vertices:
+        raise ValueError("Roof payload size does not match header")
+
+    offsets = np.frombuffer(buf, dtype="<u4", count=n_roofs + 1, offset=ROOFS_HEADER.size)
+    if offsets[0] != 0 or offsets[-1] != n_vertices or np.any(np.diff(offsets.astype(np.int64)) < 0):
+        raise ValueError("Invalid roof offsets")
+
+    coords = np.frombuffer(buf, dtype="<f8", count=3 * n_vertices, offset=coords_start)
+    coords = coords.reshape(-1, 3)
+    return [coords[offsets[i]:offsets[i + 1]] for i in range(n_roofs)]
+
+# --------------------------
+# Stats (response)
+# --------------------------
+def encode_stats(stats, analysis_id, model_file):
+    """Pack build_glb_from_roofs stats into the response format."""
+    roofs = stats.get("roofs", [])
+    snap = stats.get("snap_diag", {})
+    loc = stats.get("location", {})
+    name = model_file.encode("utf-8")
+
+    head = STATS_HEADER.pack(
+        STATS_MAGIC, VERSION, analysis_id, len(roofs), stats.get("total_parts", 0),
+        snap.get("points", 0), snap.get("clusters", 0), snap.get("merged", 0), len(name)
+    ) + name
+    head += b"\0" * _pad8(len(head))
+
+    location = array("d", [_num(loc.get(k)) for k in ("lat", "lon", "height")])
+    planes = array("f", [_num(roof.get(f)) for roof in roofs for f in PLANE_FIELDS])
+    return head + _le(location).tobytes() + _le(planes).tobytes()
+
+def decode_stats(buf):
+    """Inverse of encode_stats: (analysis_id, model_file, stats dict)."""
+    (magic, version, analysis_id, n_planes, total_parts,
+     points, clusters, merged, name_len) = STATS_HEADER.unpack_from(buf)
+    if magic != STATS_MAGIC or version != VERSION:
+        raise ValueError("Unsupported stats payload")
+    pos = STATS_HEADER.size
+    model_file = bytes(buf[pos:pos + name_len]).decode("utf-8")
+    pos += name_len
+    pos += _pad8(pos)
+
+    lat, lon, height = struct.unpack_from("<3d", buf, pos)
+    pos += 24
+    values = struct.unpack_from(f"<{n_planes * len(PLANE_FIELDS)}f", buf, pos)
+
+    roofs = []
+    for i in range(n_planes):
+        row = dict(zip(PLANE_FIELDS, values[i * len(PLANE_FIELDS):(i + 1) * len(PLANE_FIELDS)]))
+        roof = {k: (None if math.isnan(v) else round(v, 2)) for k, v in row.items()}
+        roof["index"] = int(row["index"])
+        roof["is_flat"] = bool(row["is_flat"])
+        roofs.append(roof)
+
+    stats = {
+        "total_parts": total_parts,
+        "roof_count": n_planes,
+        "roofs": roofs,
+        "snap_diag": {"points": points, "clusters": clusters, "merged": merged},
+        "location": {"lat": lat, "lon": lon, "height": height},
+    }
+    return analysis_id, model_file, stats
+
+def _num(value):
+    return math.nan if value is None else float(value)
+
+def _le(arr):
+    """Little-endian view of a stdlib array (byteswapped copy on big-endian hosts)."""
+    if sys.byteorder == "big":
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr
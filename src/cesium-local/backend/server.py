@@ -1,30 +1,97 @@
-from flask import Flask, send_from_directory, jsonify, request
+from flask import Flask, Response, send_from_directory, jsonify, request, stream_with_context
 from flask_cors import CORS
 import os
+import gzip
 import json
+import struct
+import uuid
 import numpy as np
+import requests
 import trimesh
 import geocoder
 
+from solar import (
+    AGG_LEVELS, aggregate, ecef_to_geodetic, get_orientation_surface, get_sky,
+    plane_orientation, plane_poa, series_window, slice_sky, surface_lookup, surface_optimum
+)
+from power import DC_AC_RATIO, MODULE_EFFICIENCY, simulate_power
+from roofcodec import ROOFS_MIME, STATS_MIME, decode_roofs, encode_stats
+from store import AnalysisStore
+
 app = Flask(__name__)
 CORS(app)
 
 BASE_DIR = os.path.dirname(__file__)
-STATIC_DIR = os.path.join(BASE_DIR, "static")
-OUT_FILE = "roof_model.glb"
-OUT_PATH = os.path.join(STATIC_DIR, OUT_FILE)
-STATS_FILE = os.path.join(STATIC_DIR, "roof_stats.json")
+# Overridable so tests and load runs can use a scratch store
+STATIC_DIR = os.environ.get("STATIC_DIR", os.path.join(BASE_DIR, "static"))
+DB_FILE = os.environ.get("ANALYSES_DB", os.path.join(BASE_DIR, "analyses.db"))
+GZIP_MIN_BYTES = 1024
+MAX_MODEL_FILES = int(os.environ.get("MAX_MODEL_FILES", "200"))
 os.makedirs(STATIC_DIR, exist_ok=True)
 
-def save_stats(stats):
-    with open(STATS_FILE, 'w') as f:
-        json.dump(stats, f)
+store = AnalysisStore(DB_FILE)
+
+def model_file_name():
+    """Unique GLB name per analysis so concurrent requests never share an output file."""
+    return f"roof_model_{uuid.uuid4().hex[:12]}.glb"
+
+def prune_model_files():
+    """Delete GLBs beyond the newest MAX_MODEL_FILES analyses; their stats stay in the store."""
+    for model_file in store.expire_models(MAX_MODEL_FILES):
+        try:
+            os.remove(os.path.join(STATIC_DIR, model_file))
+        except FileNotFoundError:
+            pass
+
+def load_stats(analysis_id=None):
+    """Stats of the given analysis, or of the latest one if no id is given."""
+    if analysis_id is None:
+        analysis_id = store.latest_id()
+        if analysis_id is None:
+            return None
+    return store.get(analysis_id)
 
-def load_stats():
-    if os.path.exists(STATS_FILE):
-        with open(STATS_FILE, 'r') as f:
-            return json.load(f)
-    return None
+def int_arg(name, label):
+    """
+    Optional integer query argument. Returns (value or None, None) or
+    (None, 400 response), so a malformed value is never treated as absent.
+    """
+    raw = request.args.get(name)
+    if raw is None:
+        return None, None
+    try:
+        return int(raw), None
+    except ValueError:
+        return None, (jsonify({"error": f"Invalid {label}: {raw!r}"}), 400)
+
+def load_request_stats():
+    """
+    Stats for ?id=<analysis_id>, or the latest analysis when id is absent.
+    Returns (stats, None) or (None, error response); a malformed id is a
+    400 rather than a silent fallback to the latest analysis.
+    """
+    analysis_id, error = int_arg("id", "analysis id")
+    if error:
+        return None, error
+
+    stats = load_stats(analysis_id)
+    if stats is None:
+        if analysis_id is not None:
+            return None, (jsonify({"error": f"Analysis {analysis_id} not found"}), 404)
+        return None, (jsonify({"error": "No analysis data available. Please analyze a roof first."}), 404)
+    return stats, None
+
+def fetch_sky(lat, lon, loader=get_sky):
+    """
+    Weather-derived data for a location via loader (get_sky, or
+    get_orientation_surface). Returns (value, None), or (None, 502 response)
+    when NASA POWER cannot be reached.
+    """
+    try:
+        return loader(lat, lon), None
+    except requests.RequestException as e:
+        app.logger.error(f"❌ Weather fetch failed: {str(e)}")
+        return None, (jsonify({"error": f"Weather data unavailable: {str(e)}"}), 502)
 
 # --------------------------
 # Geometry helpers
@@ -410,7 +477,7 @@ def snap_vertices_across_roofs(roof_positions, tol=0.01):
 # GLB builder (roof-only, with snapping + cleanup)
 # --------------------------
 def build_glb_from_roofs(roofs, out_path, roof_thickness=0.25, join_threshold=0.01):
-    roof_positions = [np.array(r, dtype=float) for r in roofs if len(r) >= 3]
+    roof_positions = [np.asarray(r, dtype=float) for r in roofs if len(r) >= 3]
     if not roof_positions:
         raise RuntimeError("No valid roof polygons")
 
@@ -420,6 +487,7 @@ def build_glb_from_roofs(roofs, out_path, roof_thickness=0.25, join_threshold=0.
     # In ECEF coordinates, "up" is the radial direction from Earth's center
     # The origin (centroid of all points) gives us the local "up" direction
     local_up = origin / np.linalg.norm(origin)
+    lat, lon, height = ecef_to_geodetic(origin)
 
     # Compute tilt and azimuth BEFORE centering (using ECEF local up)
     pre_rotation_data = []
@@ -521,9 +589,88 @@ def build_glb_from_roofs(roofs, out_path, roof_thickness=0.25, join_threshold=0.
         "total_parts": len(parts),
         "roof_count": len(roof_infos),
         "roofs": roof_infos,
-        "snap_diag": snap_diag
+        "snap_diag": snap_diag,
+        "location": {"lat": round(lat, 6), "lon": round(lon, 6), "height": round(height, 2)}
     }
 
+# --------------------------
+# Time-series streaming
+# --------------------------
+SERIES_MAGIC = b"SRTS"
+SERIES_VERSION = 1
+NDJSON_CHUNK_ROWS = 744  # one month of hourly rows per line
+
+def plane_series(sky, roofs, window):
+    """
+    Yield (roof, poa, energy) per plane for a resolved series window.
+    poa is Wh/m² per bucket, energy is kWh incident on the panel area.
+    """
+    i0, i1, starts, _ = window
+    window_sky = slice_sky(sky, i0, i1)
+    for roof in roofs:
+        tilt, azimuth = plane_orientation(roof, sky["lat"])
+        poa = aggregate(plane_poa(window_sky, tilt, azimuth), 0, i1 - i0, starts)
+        energy = poa * (roof.get("panel_area") or 0.0) / 1000
+        yield roof, poa, energy
+
+def iter_series_ndjson(sky, roofs, window, agg):
+    """
+    NDJSON stream: a header line, then per-plane lines holding up to
+    NDJSON_CHUNK_ROWS buckets each (epoch seconds, Wh/m², kWh).
+    """
+    bucket_epoch = window[3]
+    yield json.dumps({
+        "agg": agg,
+        "planes": [r["index"] for r in roofs],
+        "buckets": int(len(bucket_epoch)),
+        "units": {"time": "s", "poa": "Wh/m2", "energy": "kWh"},
+    }) + "\n"
+    for roof, poa, energy in plane_series(sky, roofs, window):
+        for k in range(0, len(bucket_epoch), NDJSON_CHUNK_ROWS):
+            chunk = slice(k, k + NDJSON_CHUNK_ROWS)
+            yield json.dumps({
+                "plane": roof["index"],
+                "time": bucket_epoch[chunk].tolist(),
+                "poa": np.round(poa[chunk], 2).tolist(),
+                "energy": np.round(energy[chunk], 4).tolist(),
+            }) + "\n"
+
+def iter_series_packed(sky, roofs, window):
+    """
+    Packed little-endian stream:
+      b"SRTS", uint32 version, uint32 n_buckets, uint32 n_planes,
+      int64[n_buckets] bucket start (UTC epoch seconds),
+      then per plane: int32 index, float32[n_buckets] poa, float32[n_buckets] energy.
+    """
+    bucket_epoch = window[3]
+    yield SERIES_MAGIC + struct.pack("<III", SERIES_VERSION, len(bucket_epoch), len(roofs))
+    yield bucket_epoch.astype("<i8").tobytes()
+    for roof, poa, energy in plane_series(sky, roofs, window):
+        yield (struct.pack("<i", roof["index"])
+               + poa.astype("<f4").tobytes()
+               + energy.astype("<f4").tobytes())
+
+# --------------------------
+# Response encoding
+# --------------------------
+def compact_response(payload, packed=None, status=200):
+    """
+    Encode payload as minified JSON, or with packed() when the client
+    prefers STATS_MIME, and gzip it if accepted and worth compressing.
+    """
+    if packed is not None and request.accept_mimetypes.best_match(["application/json", STATS_MIME]) == STATS_MIME:
+        body, mimetype = packed(), STATS_MIME
+    else:
+        body, mimetype = json.dumps(payload, separators=(",", ":")).encode("utf-8"), "application/json"
+
+    response = Response(body, status=status, mimetype=mimetype)
+    response.vary.add("Accept")
+    response.vary.add("Accept-Encoding")
+    if len(body) >= GZIP_MIN_BYTES and request.accept_encodings["gzip"] > 0:
+        response.set_data(gzip.compress(body, compresslevel=6))
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
 # --------------------------
 # API Routes
 # --------------------------
@@ -556,30 +703,47 @@ def detect_location():
 
 @app.route("/api/analyze", methods=["POST"])
 def analyze():
+    """
+    Roofs arrive as JSON ({"roofs": [[[x, y, z], ...], ...], "params": {...}})
+    or as a packed ROOFS_MIME body with params in the query string.
+    """
     try:
-        data = request.get_json() or {}
-        roofs = data.get("roofs", [])
-        params = data.get("params", {}) or {}
+        if request.mimetype == ROOFS_MIME:
+            try:
+                roofs = decode_roofs(request.get_data(cache=False))
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            params = request.args
+        else:
+            data = request.get_json() or {}
+            roofs = data.get("roofs", [])
+            params = data.get("params", {}) or {}
         if not roofs:
             return jsonify({"error": "No roof data provided"}), 400
 
         join_threshold = float(params.get("join_threshold", 0.5))
         roof_thickness = float(params.get("roof_thickness", 0.25))
 
+        model_file = model_file_name()
         stats = build_glb_from_roofs(
             roofs,
-            OUT_PATH,
+            os.path.join(STATIC_DIR, model_file),
             roof_thickness=roof_thickness,
             join_threshold=join_threshold
         )
 
-        save_stats(stats)
+        analysis_id = store.save(stats, model_file)
+        prune_model_files()
 
-        return jsonify({
-            "success": True,
-            "file": OUT_FILE,
-            "stats": stats
-        })
+        return compact_response(
+            {
+                "success": True,
+                "analysis_id": analysis_id,
+                "file": model_file,
+                "stats": stats
+            },
+            packed=lambda: encode_stats(stats, analysis_id, model_file)
+        )
 
     except Exception as e:
         app.logger.error(f"❌ Error: {str(e)}", exc_info=True)
@@ -587,24 +751,262 @@ def analyze():
 
 @app.route("/api/status")
 def status():
-    exists = os.path.exists(OUT_PATH)
+    stats = load_stats()
+    model_file = stats["model_file"] if stats else None
+    exists = bool(model_file) and os.path.exists(os.path.join(STATIC_DIR, model_file))
     return jsonify({
         "model_exists": exists,
-        "model_file": OUT_FILE if exists else None
+        "model_file": model_file if exists else None,
+        "analysis_id": stats["analysis_id"] if stats else None
     })
 
 @app.route("/api/roof-info")
 def roof_info():
-    stats = load_stats()
-    if stats is None:
-        return jsonify({"error": "No analysis data available. Please analyze a roof first."}), 404
+    """Stats for ?id=<analysis_id>, or the latest analysis if no id is given."""
+    stats, error = load_request_stats()
+    if error:
+        return error
     return jsonify(stats)
 
+@app.route("/api/analyses/nearby")
+def analyses_nearby():
+    """Analyses within ?radius= meters (default 100) of ?lat=&lon=, nearest first."""
+    lat = request.args.get("lat", type=float)
+    lon = request.args.get("lon", type=float)
+    radius = request.args.get("radius", 100.0, type=float)
+    limit = request.args.get("limit", 50, type=int)
+    if lat is None or lon is None:
+        return jsonify({"error": "lat and lon are required"}), 400
+    if radius <= 0:
+        return jsonify({"error": "radius must be positive"}), 400
+    return jsonify({"analyses": store.nearby(lat, lon, radius, limit=limit)})
+
+@app.route("/api/timeseries")
+def timeseries():
+    """
+    Stream per-plane POA/energy series for ?id=<analysis_id> (default latest).
+    Query: plane (index, default all), agg (hourly|daily|monthly),
+    start/end (ISO dates, local standard time, inclusive), format (ndjson|f32).
+    """
+    stats, error = load_request_stats()
+    if error:
+        return error
+    location = stats["location"]
+
+    agg = request.args.get("agg", "hourly")
+    fmt = request.args.get("format", "ndjson")
+    plane, error = int_arg("plane", "plane index")
+    if error:
+        return error
+    if agg not in AGG_LEVELS:
+        return jsonify({"error": f"agg must be one of {', '.join(AGG_LEVELS)}"}), 400
+    if fmt not in ("ndjson", "f32"):
+        return jsonify({"error": "format must be ndjson or f32"}), 400
+
+    roofs = [r for r in stats.get("roofs", []) if plane is None or r["index"] == plane]
+    if not roofs:
+        return jsonify({"error": f"Plane {plane} not found"}), 404
+
+    sky, error = fetch_sky(location["lat"], location["lon"])
+    if error:
+        return error
+
+    try:
+        window = series_window(sky, agg, request.args.get("start"), request.args.get("end"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if fmt == "f32":
+        body = iter_series_packed(sky, roofs, window)
+        mimetype = "application/octet-stream"
+    else:
+        body = iter_series_ndjson(sky, roofs, window, agg)
+        mimetype = "application/x-ndjson"
+    return Response(stream_with_context(body), mimetype=mimetype)
+
+@app.route("/api/orientation")
+def orientation():
+    """
+    Annual/monthly POA yield of each plane of ?id=<analysis_id> (default
+    latest), read off the location's tilt x azimuth surface and compared
+    with the best orientation. ?surface=1 also returns the annual grid.
+    """
+    stats, error = load_request_stats()
+    if error:
+        return error
+    location = stats["location"]
+
+    surface, error = fetch_sky(location["lat"], location["lon"], get_orientation_surface)
+    if error:
+        return error
+
+    best_tilt, best_azimuth, best_annual = surface_optimum(surface)
+    planes = []
+    for roof in stats["roofs"]:
+        tilt, azimuth = plane_orientation(roof, location["lat"])
+        annual = float(surface_lookup(surface, tilt, azimuth))
+        monthly = surface_lookup(surface, tilt, azimuth, field="monthly")
+        planes.append({
+            "index": roof["index"],
+            "tilt": tilt,
+            "azimuth": azimuth,
+            "annual_kwh_m2": round(annual, 2),
+            "monthly_kwh_m2": np.round(monthly, 2).tolist(),
+            "relative_to_optimum": round(annual / best_annual, 4) if best_annual > 0 else None,
+        })
+
+    result = {
+        "analysis_id": stats["analysis_id"],
+        "optimum": {"tilt": best_tilt, "azimuth": best_azimuth, "annual_kwh_m2": round(best_annual, 2)},
+        "planes": planes,
+    }
+    if request.args.get("surface") == "1":
+        result["surface"] = {
+            "tilts": surface["tilts"].tolist(),
+            "azimuths": surface["azimuths"].tolist(),
+            "annual_kwh_m2": np.round(surface["annual"], 1).tolist(),
+        }
+    return compact_response(result)
+
+@app.route("/api/orientation/lookup", methods=["POST"])
+def orientation_lookup():
+    """
+    Batch screening: {"lat", "lon", "planes": [[tilt, azimuth], ...]} ->
+    annual POA yield (kWh/m²) per plane from the cached surface.
+    """
+    data = request.get_json() or {}
+    try:
+        lat, lon = float(data["lat"]), float(data["lon"])
+        planes = np.asarray(data.get("planes", []), dtype=float).reshape(-1, 2)
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "Expected lat, lon and planes as [[tilt, azimuth], ...]"}), 400
+    if not (np.isfinite([lat, lon]).all() and np.isfinite(planes).all()):
+        return jsonify({"error": "lat, lon and planes must be finite numbers"}), 400
+
+    surface, error = fetch_sky(lat, lon, get_orientation_surface)
+    if error:
+        return error
+
+    annual = surface_lookup(surface, planes[:, 0], planes[:, 1])
+    return jsonify({"annual_kwh_m2": np.round(annual, 2).tolist()})
+
+def power_options(args):
+    """simulate_power keyword overrides from request parameters."""
+    options = {}
+    for name, default in (("module_efficiency", MODULE_EFFICIENCY), ("dc_ac_ratio", DC_AC_RATIO)):
+        value = float(args.get(name, default))
+        if value <= 0:
+            raise ValueError(f"{name} must be positive")
+        options[name] = value
+    return options
+
+@app.route("/api/power")
+def power():
+    """
+    Hourly AC output of ?id=<analysis_id> (default latest) after cell
+    temperature, DC, inverter efficiency and clipping.
+    Query: agg/start/end as /api/timeseries, inverters (per-plane inverter
+    numbers, e.g. 0,0,1; default one inverter), module_efficiency, dc_ac_ratio.
+    """
+    stats, error = load_request_stats()
+    if error:
+        return error
+    location = stats["location"]
+    roofs = stats["roofs"]
+
+    try:
+        options = power_options(request.args)
+        inverters = request.args.get("inverters")
+        inverter_map = [int(i) for i in inverters.split(",")] if inverters else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    sky, error = fetch_sky(location["lat"], location["lon"])
+    if error:
+        return error
+
+    agg = request.args.get("agg", "hourly")
+    try:
+        i0, i1, starts, bucket_epoch = series_window(sky, agg, request.args.get("start"), request.args.get("end"))
+        result = simulate_power(sky, [roofs], inverter_maps=[inverter_map], **options)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    ac_kwh = aggregate(result["building_ac_kwh"][0], i0, i1, starts)
+    dc_kwh = result["dc_w"][:, i0:i1].sum(axis=1) / 1000
+    inverter_ac_kwh = result["ac_w"][:, i0:i1].sum(axis=1) / 1000
+
+    return compact_response({
+        "analysis_id": stats["analysis_id"],
+        "agg": agg,
+        "time": bucket_epoch.tolist(),
+        "ac_kwh": np.round(ac_kwh, 4).tolist(),
+        "total_ac_kwh": round(float(ac_kwh.sum()), 2),
+        "planes": [
+            {"index": roof["index"], "capacity_kw": round(float(c) / 1000, 3), "dc_kwh": round(float(e), 2)}
+            for roof, c, e in zip(roofs, result["capacity_w"], dc_kwh)
+        ],
+        "inverters": [
+            {
+                "index": k,
+                "ac_rating_kw": round(float(result["ac_rating_w"][k]) / 1000, 3),
+                "ac_kwh": round(float(inverter_ac_kwh[k]), 2),
+                "annual_clipped_hours": int(result["clipped_hours"][k]),
+            }
+            for k in range(len(inverter_ac_kwh))
+        ],
+    })
+
+@app.route("/api/power/batch", methods=["POST"])
+def power_batch():
+    """
+    Annual and monthly AC kWh for many analyses: {"ids": [...], optional
+    "module_efficiency", "dc_ac_ratio"}. Analyses sharing a location are
+    simulated together in one pass.
+    """
+    data = request.get_json() or {}
+    try:
+        ids = [int(i) for i in data.get("ids", [])]
+        options = power_options(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    if not ids:
+        return jsonify({"error": "No analysis ids provided"}), 400
+
+    groups = {}
+    missing = []
+    for analysis_id in ids:
+        stats = store.get(analysis_id)
+        if stats is None:
+            missing.append(analysis_id)
+            continue
+        sky, error = fetch_sky(stats["location"]["lat"], stats["location"]["lon"])
+        if error:
+            return error
+        groups.setdefault(id(sky), (sky, []))[1].append(stats)
+
+    results = {}
+    for sky, members in groups.values():
+        i0, i1, starts, _ = series_window(sky, "monthly")
+        result = simulate_power(sky, [m["roofs"] for m in members], **options)
+        monthly = aggregate(result["building_ac_kwh"], i0, i1, starts)
+        for stats, months in zip(members, monthly):
+            results[stats["analysis_id"]] = {
+                "annual_ac_kwh": round(float(months.sum()), 2),
+                "monthly_ac_kwh": np.round(months, 2).tolist(),
+            }
+
+    return compact_response({
+        "analyses": [dict(results[i], analysis_id=i) for i in ids if i in results],
+        "missing": missing,
+    })
+
 # --------------------------
 # Main
 # --------------------------
 if __name__ == "__main__":
     import os
     debug_mode = os.environ.get("FLASK_DEBUG", "false").lower() == "true"
-    app.run(host="0.0.0.0", port=8000, debug=debug_mode, threaded=True)
+    port = int(os.environ.get("PORT", "8000"))
+    app.run(host="0.0.0.0", port=port, debug=debug_mode, threaded=True)
 
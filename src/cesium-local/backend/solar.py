@@ -0,0 +1,462 @@
+"""
+Hourly solar irradiance model for the roof analysis backend.
+
+Mirrors the pipeline in src/cal.py (NASA POWER hourly data, pvlib solar
+position, Kasten-Young airmass, Perez transposition) but keeps everything
+as NumPy arrays so that slicing and aggregation never build intermediate
+DataFrames. Weather and solar geometry are computed once per location and
+kept in a bounded in-memory LRU.
+
+For orientation questions, build_orientation_surface evaluates the same
+Perez model over a dense tilt x azimuth grid in one pass, so the yield of
+any plane becomes a bilinear lookup.
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+import pandas as pd
+import pvlib
+import requests
+
+POWER_URL = "https://power.larc.nasa.gov/api/temporal/hourly/point"
+POWER_PARAMS = "ALLSKY_SFC_SW_DWN,ALLSKY_SFC_SW_DNI,ALLSKY_SFC_SW_DIFF,T2M,PS,WS2M"
+POWER_FILL_VALUE = -999.0
+WEATHER_YEAR = 2024
+
+AGG_LEVELS = ("hourly", "daily", "monthly")
+
+SURFACE_TILTS = np.arange(0.0, 91.0, 1.0)
+SURFACE_AZIMUTHS = np.arange(0.0, 360.0, 1.0)
+GROUND_ALBEDO = 0.25  # pvlib default
+
+# WGS84 ellipsoid
+WGS84_A = 6378137.0
+WGS84_E2 = 6.69437999014e-3
+
+# --------------------------
+# Caching
+# --------------------------
+# Entries are per ~1 km cell: a sky is ~1 MB, a surface ~3.4 MB
+SKY_CACHE_SIZE = 64
+SURFACE_CACHE_SIZE = 16
+
+class BuildCache:
+    """
+    Bounded LRU of expensive per-key results. Concurrent misses on one key
+    share a single build; a failed build is not cached.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            future = self._pending.get(key)
+            owner = future is None
+            if owner:
+                future = self._pending[key] = Future()
+        if not owner:
+            return future.result()
+
+        try:
+            value = build()
+        except BaseException as e:
+            with self._lock:
+                del self._pending[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._pending[key]
+            self._entries[key] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        future.set_result(value)
+        return value
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+_sky_cache = BuildCache(SKY_CACHE_SIZE)
+_surface_cache = BuildCache(SURFACE_CACHE_SIZE)
+
+# --------------------------
+# Location helpers
+# --------------------------
+def ecef_to_geodetic(xyz, iterations=5):
+    """
+    Convert an ECEF point (meters) to WGS84 latitude/longitude (degrees)
+    and ellipsoidal height (meters).
+    """
+    x, y, z = (float(c) for c in xyz)
+    lon = np.arctan2(y, x)
+    p = np.hypot(x, y)
+    lat = np.arctan2(z, p * (1 - WGS84_E2))
+    h = 0.0
+    for _ in range(iterations):
+        sin_lat = np.sin(lat)
+        n = WGS84_A / np.sqrt(1 - WGS84_E2 * sin_lat ** 2)
+        h = p / np.cos(lat) - n
+        lat = np.arctan2(z, p * (1 - WGS84_E2 * n / (n + h)))
+    return float(np.degrees(lat)), float(np.degrees(lon)), float(h)
+
+def utc_offset_hours(lon):
+    """Standard-time offset approximated from longitude (15° per hour)."""
+    return int(round(lon / 15.0))
+
+def plane_orientation(roof, lat):
+    """
+    Tilt/azimuth used for transposition. Flat planes have no azimuth in
+    roof_infos, so they are treated as facing the equator.
+    """
+    tilt = roof.get("tilt") or 0.0
+    azimuth = roof.get("azimuth")
+    if azimuth is None:
+        azimuth = 180.0 if lat >= 0 else 0.0
+    return float(tilt), float(azimuth)
+
+# --------------------------
+# Weather + solar geometry
+# --------------------------
+def fetch_weather(lat, lon, year=WEATHER_YEAR):
+    """
+    Fetch one year of hourly NASA POWER data in UTC.
+    Returns (naive UTC DatetimeIndex, dict of float arrays).
+    """
+    params = {
+        "start": f"{year}0101",
+        "end": f"{year}1231",
+        "latitude": lat,
+        "longitude": lon,
+        "community": "RE",
+        "parameters": POWER_PARAMS,
+        "time-standard": "UTC",
+        "format": "JSON",
+    }
+    response = requests.get(POWER_URL, params=params, timeout=60)
+    response.raise_for_status()
+    hourly = response.json()["properties"]["parameter"]
+
+    keys = list(hourly["ALLSKY_SFC_SW_DWN"].keys())
+
+    def column(name):
+        values = np.fromiter((hourly[name][k] for k in keys), dtype=float, count=len(keys))
+        values[values <= POWER_FILL_VALUE] = np.nan
+        return values
+
+    weather = {
+        "ghi": np.nan_to_num(column("ALLSKY_SFC_SW_DWN")),
+        "dni": np.nan_to_num(column("ALLSKY_SFC_SW_DNI")),
+        "dhi": np.nan_to_num(column("ALLSKY_SFC_SW_DIFF")),
+        "temp_air": column("T2M"),  # degC
+        "pressure_pa": column("PS") * 1000,  # kPa -> Pa
+        "wind_speed": column("WS2M"),  # m/s at 2 m
+    }
+    for name in ("temp_air", "pressure_pa", "wind_speed"):
+        col = weather[name]
+        col[np.isnan(col)] = np.nanmean(col) if np.isfinite(col).any() else 0.0
+
+    times = pd.to_datetime(keys, format="%Y%m%d%H")
+    return times, weather
+
+def compute_sky(lat, lon, year=WEATHER_YEAR):
+    """
+    Build the per-location sky state shared by every plane: weather arrays,
+    solar position, airmass and extraterrestrial DNI.
+    """
+    times, weather = fetch_weather(lat, lon, year)
+    times_utc = times.tz_localize("UTC")
+
+    solpos = pvlib.solarposition.get_solarposition(
+        time=times_utc,
+        latitude=lat,
+        longitude=lon,
+        altitude=0,
+        temperature=weather["temp_air"],
+        pressure=weather["pressure_pa"]
+    )
+    zenith = solpos["apparent_zenith"].to_numpy()
+    azimuth = solpos["azimuth"].to_numpy()
+    airmass = np.asarray(
+        pvlib.atmosphere.get_relative_airmass(zenith, model="kastenyoung1989"),
+        dtype=float
+    )
+    dni_extra = np.asarray(pvlib.irradiance.get_extra_radiation(times_utc), dtype=float)
+
+    sky = dict(weather)
+    sky.update({
+        "lat": lat,
+        "lon": lon,
+        "utc_offset": utc_offset_hours(lon),
+        "epoch": times.to_numpy().astype("datetime64[s]").astype(np.int64),
+        "solar_zenith": zenith,
+        "solar_azimuth": azimuth,
+        "airmass": airmass,
+        "dni_extra": dni_extra,
+    })
+    return sky
+
+def _location_key(lat, lon, year):
+    """Cache key: location rounded to ~1 km."""
+    return round(lat, 2), round(lon, 2), year
+
+def get_sky(lat, lon, year=WEATHER_YEAR):
+    """Cached compute_sky."""
+    key = _location_key(lat, lon, year)
+    return _sky_cache.get(key, lambda: compute_sky(key[0], key[1], year))
+
+def plane_poa(sky, tilt, azimuth):
+    """Hourly plane-of-array global irradiance (W/m²) using the Perez model."""
+    poa = pvlib.irradiance.get_total_irradiance(
+        surface_tilt=tilt,
+        surface_azimuth=azimuth,
+        dni=sky["dni"],
+        ghi=sky["ghi"],
+        dhi=sky["dhi"],
+        solar_zenith=sky["solar_zenith"],
+        solar_azimuth=sky["solar_azimuth"],
+        model="perez",
+        airmass=sky["airmass"],
+        dni_extra=sky["dni_extra"]
+    )
+    return np.nan_to_num(np.asarray(poa["poa_global"], dtype=float))
+
+# --------------------------
+# Tilt x azimuth yield surface
+# --------------------------
+def _perez_component(sky, surface_tilt, surface_azimuth, name):
+    """
+    One pvlib Perez diffuse component (W/m²). pvlib 0.14 renamed the
+    component keys from e.g. "isotropic" to "poa_isotropic"; accept both.
+    """
+    comps = pvlib.irradiance.perez(
+        surface_tilt=surface_tilt,
+        surface_azimuth=surface_azimuth,
+        dhi=sky["dhi"],
+        dni=sky["dni"],
+        dni_extra=sky["dni_extra"],
+        solar_zenith=sky["solar_zenith"],
+        solar_azimuth=sky["solar_azimuth"],
+        airmass=sky["airmass"],
+        return_components=True
+    )
+    key = "poa_" + name if "poa_" + name in comps else name
+    return np.asarray(comps[key], dtype=float)
+
+def perez_sky_valid(sky):
+    """
+    Hours where pvlib's Perez model produces sky diffuse: it zeroes the
+    whole sky dome wherever airmass is undefined (sun below the horizon).
+    """
+    return np.isfinite(sky["airmass"]) & (np.cos(np.radians(sky["solar_zenith"])) > 0)
+
+def perez_factors(sky):
+    """
+    Hourly Perez brightness coefficients F1/F2, recovered from pvlib's
+    component output: on a horizontal plane isotropic = dhi * (1 - F1)
+    (its total can never clamp to 0, which would mask the components),
+    and on a vertical sun-facing plane horizon = dhi * F2. Both are 0
+    outside perez_sky_valid.
+    """
+    dhi = sky["dhi"]
+    valid = perez_sky_valid(sky) & (dhi > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        f1 = np.where(valid, 1 - _perez_component(sky, 0.0, 180.0, "isotropic") / dhi, 0.0)
+        f2 = np.where(valid, _perez_component(sky, 90.0, sky["solar_azimuth"], "horizon") / dhi, 0.0)
+    return np.nan_to_num(f1), np.nan_to_num(f2)
+
+def month_index(sky):
+    """Local-standard-time month (0-11) of every hour."""
+    local = (sky["epoch"] + sky["utc_offset"] * 3600).astype("datetime64[s]")
+    return local.astype("datetime64[M]").astype(np.int64) % 12
+
+def perez_terms(sky, albedo=GROUND_ALBEDO):
+    """
+    Hourly arrays of the Perez POA decomposition
+        poa = max(cos(aoi), 0) * (beam + circumsolar)
+              + isotropic * (1 + cos t) / 2 + horizon * sin t + ground * (1 - cos t) / 2
+    with cos(aoi) = cos t * cos_z + sin t * (sin az * sun_e + cos az * sun_n).
+    Only the first term depends on surface azimuth; beam_weight is
+    beam + circumsolar.
+    """
+    zenith = np.radians(sky["solar_zenith"])
+    sun_az = np.radians(sky["solar_azimuth"])
+    cos_z = np.cos(zenith)
+
+    f1, f2 = perez_factors(sky)
+    dni, ghi = sky["dni"], sky["ghi"]
+    dhi = np.where(perez_sky_valid(sky), sky["dhi"], 0.0)
+    b = np.maximum(np.cos(np.radians(85.0)), cos_z)
+    circumsolar = dhi * f1 / b
+    return {
+        "cos_z": cos_z,
+        "sun_e": np.sin(zenith) * np.sin(sun_az),
+        "sun_n": np.sin(zenith) * np.cos(sun_az),
+        "beam": dni,
+        "circumsolar": circumsolar,
+        "beam_weight": dni + circumsolar,
+        "isotropic": dhi * (1 - f1),
+        "horizon": dhi * f2,
+        "ground": ghi * albedo,
+    }
+
+def poa_matrix(sky, tilts, azimuths):
+    """
+    Hourly POA global irradiance (W/m²) for many planes at once:
+    planes x hours, from per-plane tilt/azimuth arrays.
+    """
+    terms = perez_terms(sky)
+    t = np.radians(np.asarray(tilts, dtype=float))[:, None]
+    az = np.radians(np.asarray(azimuths, dtype=float))[:, None]
+    ct, st = np.cos(t), np.sin(t)
+
+    cos_aoi = ct * terms["cos_z"] + st * (np.sin(az) * terms["sun_e"] + np.cos(az) * terms["sun_n"])
+    np.maximum(cos_aoi, 0.0, out=cos_aoi)
+    # pvlib clamps each plane's sky diffuse at 0
+    sky_diffuse = cos_aoi * terms["circumsolar"]
+    sky_diffuse += terms["isotropic"] * (1 + ct) / 2 + terms["horizon"] * st
+    np.maximum(sky_diffuse, 0.0, out=sky_diffuse)
+    poa = cos_aoi * terms["beam"]
+    poa += sky_diffuse + terms["ground"] * (1 - ct) / 2
+    return poa
+
+def build_orientation_surface(sky, tilts=SURFACE_TILTS, azimuths=SURFACE_AZIMUTHS,
+                              albedo=GROUND_ALBEDO):
+    """
+    Monthly and annual POA irradiation (kWh/m²) for every tilt x azimuth.
+
+    Uses the perez_terms decomposition: hours are folded into months with a
+    single matrix product per tilt row, so memory stays at azimuths x hours.
+    """
+    terms = perez_terms(sky, albedo)
+    cos_z = terms["cos_z"]
+
+    month = month_index(sky)
+    months = np.zeros((len(month), 12))
+    months[np.arange(len(month)), month] = 1.0
+    beam_monthly = months * terms["beam_weight"][:, None]  # hours x 12
+    iso_monthly = terms["isotropic"] @ months              # 12
+    horizon_monthly = terms["horizon"] @ months
+    ground_monthly = terms["ground"] @ months
+
+    az = np.radians(azimuths)
+    sin_az, cos_az = np.sin(az), np.cos(az)
+    horizontal = np.outer(sin_az, terms["sun_e"]) + np.outer(cos_az, terms["sun_n"])  # azimuths x hours
+
+    monthly = np.empty((len(tilts), len(azimuths), 12))
+    for i, tilt in enumerate(np.radians(tilts)):
+        ct, st = np.cos(tilt), np.sin(tilt)
+        cos_aoi = st * horizontal
+        cos_aoi += ct * cos_z
+        np.maximum(cos_aoi, 0.0, out=cos_aoi)
+        monthly[i] = cos_aoi @ beam_monthly
+        monthly[i] += iso_monthly * (1 + ct) / 2 + horizon_monthly * st + ground_monthly * (1 - ct) / 2
+    monthly /= 1000  # Wh/m² -> kWh/m²
+
+    return {
+        "tilts": np.asarray(tilts, dtype=float),
+        "azimuths": np.asarray(azimuths, dtype=float),
+        "monthly": monthly,
+        "annual": monthly.sum(axis=-1),
+    }
+
+def get_orientation_surface(lat, lon, year=WEATHER_YEAR):
+    """Cached build_orientation_surface for a location."""
+    key = _location_key(lat, lon, year)
+    return _surface_cache.get(key, lambda: build_orientation_surface(get_sky(lat, lon, year)))
+
+def surface_lookup(surface, tilt, azimuth, field="annual"):
+    """
+    Bilinear lookup of a surface field at arbitrary tilt/azimuth (scalars or
+    arrays). Azimuth wraps around 360°; tilt is clamped to the grid.
+    """
+    tilts, azimuths, grid = surface["tilts"], surface["azimuths"], surface[field]
+    tilt = np.clip(np.asarray(tilt, dtype=float), tilts[0], tilts[-1])
+    azimuth = np.mod(np.asarray(azimuth, dtype=float), 360.0)
+
+    ft = (tilt - tilts[0]) / (tilts[1] - tilts[0])
+    i0 = np.minimum(np.floor(ft).astype(int), len(tilts) - 2)
+    wt = np.asarray(ft - i0)
+    fa = (azimuth - azimuths[0]) / (azimuths[1] - azimuths[0])
+    ja = np.floor(fa)
+    wa = np.asarray(fa - ja)
+    j0 = ja.astype(int) % len(azimuths)
+    j1 = (j0 + 1) % len(azimuths)
+
+    extra = (Ellipsis,) + (None,) * (grid.ndim - 2)
+    wt, wa = wt[extra], wa[extra]
+    return ((1 - wt) * (1 - wa) * grid[i0, j0] + (1 - wt) * wa * grid[i0, j1]
+            + wt * (1 - wa) * grid[i0 + 1, j0] + wt * wa * grid[i0 + 1, j1])
+
+def surface_optimum(surface):
+    """Best grid orientation: (tilt, azimuth, annual kWh/m²)."""
+    annual = surface["annual"]
+    i, j = np.unravel_index(np.argmax(annual), annual.shape)
+    return float(surface["tilts"][i]), float(surface["azimuths"][j]), float(annual[i, j])
+
+# --------------------------
+# Slicing + aggregation
+# --------------------------
+def _parse_local_time(value, offset_hours, inclusive_end=False):
+    """
+    Parse an ISO date/datetime in local standard time to UTC epoch seconds.
+    A date-only end bound covers the whole day.
+    """
+    try:
+        t = np.datetime64(value)
+    except ValueError:
+        raise ValueError(f"Invalid date: {value!r}")
+    if inclusive_end and np.datetime_data(t.dtype)[0] in ("Y", "M", "D"):
+        unit = np.datetime_data(t.dtype)[0]
+        t = (t + np.timedelta64(1, unit)).astype("datetime64[D]")
+    seconds = t.astype("datetime64[s]").astype(np.int64)
+    return int(seconds) - offset_hours * 3600
+
+def series_window(sky, agg="hourly", start=None, end=None):
+    """
+    Resolve a date range and aggregation level against the sky's hourly
+    timeline. Returns (i0, i1, bucket_starts, bucket_epoch) where
+    bucket_starts are offsets into [i0, i1) suitable for np.add.reduceat
+    and bucket_epoch are the UTC epoch seconds of each bucket's first hour.
+    """
+    if agg not in AGG_LEVELS:
+        raise ValueError(f"agg must be one of {', '.join(AGG_LEVELS)}")
+
+    epoch = sky["epoch"]
+    offset = sky["utc_offset"]
+    i0, i1 = 0, len(epoch)
+    if start:
+        i0 = int(np.searchsorted(epoch, _parse_local_time(start, offset), side="left"))
+    if end:
+        i1 = int(np.searchsorted(epoch, _parse_local_time(end, offset, inclusive_end=True), side="left"))
+    if i1 <= i0:
+        raise ValueError("Empty date range")
+
+    window = epoch[i0:i1]
+    if agg == "hourly":
+        starts = np.arange(len(window))
+    else:
+        local = (window + offset * 3600).astype("datetime64[s]")
+        keys = local.astype("datetime64[D]" if agg == "daily" else "datetime64[M]")
+        starts = np.concatenate(([0], np.flatnonzero(keys[1:] != keys[:-1]) + 1))
+    return i0, i1, starts, window[starts]
+
+def aggregate(values, i0, i1, starts):
+    """Sum hourly values (last axis) into buckets of the given window."""
+    return np.add.reduceat(values[..., i0:i1], starts, axis=-1)
+
+def slice_sky(sky, i0, i1):
+    """Sky restricted to hours [i0, i1); per-site scalars are kept as is."""
+    hours = len(sky["epoch"])
+    return {
+        k: v[i0:i1] if isinstance(v, np.ndarray) and v.shape[-1:] == (hours,) else v
+        for k, v in sky.items()
+    }
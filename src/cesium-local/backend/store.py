@@ -0,0 +1,212 @@
+"""
+Persistent analysis store.
+
+Every /api/analyze run is recorded in an embedded SQLite database (WAL mode,
+so readers never block the writer) together with its location, per-plane
+stats and the GLB it produced. An R-tree over lat/lon answers "analyses
+within X m of this point" without scanning the table.
+"""
+import math
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEG_LAT = 111320.0
+
+PLANE_FIELDS = (
+    "tilt", "azimuth", "color_name", "is_flat",
+    "panel_width", "panel_height", "panel_area",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    height REAL,
+    total_parts INTEGER,
+    roof_count INTEGER,
+    snap_points INTEGER,
+    snap_clusters INTEGER,
+    snap_merged INTEGER,
+    model_file TEXT
+);
+CREATE TABLE IF NOT EXISTS planes (
+    analysis_id INTEGER NOT NULL REFERENCES analyses(id) ON DELETE CASCADE,
+    plane_index INTEGER NOT NULL,
+    tilt REAL,
+    azimuth REAL,
+    color_name TEXT,
+    is_flat INTEGER,
+    panel_width REAL,
+    panel_height REAL,
+    panel_area REAL,
+    PRIMARY KEY (analysis_id, plane_index)
+) WITHOUT ROWID;
+CREATE VIRTUAL TABLE IF NOT EXISTS analyses_rtree USING rtree(
+    id, min_lat, max_lat, min_lon, max_lon
+);
+"""
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in meters."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+class AnalysisStore:
+    """
+    SQLite-backed analysis history. Connections are shared through a small
+    pool, since the dev server starts a new thread for every request.
+    """
+
+    def __init__(self, path, pool_size=8):
+        self.path = path
+        self._pool = queue.LifoQueue()
+        self._slots = threading.Semaphore(pool_size)
+
+        # journal_mode is persistent in the database file, so set it once
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        self._pool.put(conn)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    @contextmanager
+    def _conn(self):
+        """Borrow a pooled connection, opening one if the pool has spare slots."""
+        with self._slots:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            try:
+                yield conn
+            finally:
+                self._pool.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    # --------------------------
+    # Writes
+    # --------------------------
+    def save(self, stats, model_file):
+        """Record an analysis (build_glb_from_roofs stats). Returns its id."""
+        loc = stats["location"]
+        snap = stats.get("snap_diag", {})
+        with self._conn() as conn, conn:
+            cur = conn.execute(
+                "INSERT INTO analyses (created_at, lat, lon, height, total_parts, roof_count,"
+                " snap_points, snap_clusters, snap_merged, model_file)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), loc["lat"], loc["lon"], loc.get("height"),
+                 stats.get("total_parts"), stats.get("roof_count"),
+                 snap.get("points"), snap.get("clusters"), snap.get("merged"), model_file)
+            )
+            analysis_id = cur.lastrowid
+            conn.execute(
+                "INSERT INTO analyses_rtree VALUES (?, ?, ?, ?, ?)",
+                (analysis_id, loc["lat"], loc["lat"], loc["lon"], loc["lon"])
+            )
+            conn.executemany(
+                "INSERT INTO planes (analysis_id, plane_index, " + ", ".join(PLANE_FIELDS) + ")"
+                " VALUES (?, ?" + ", ?" * len(PLANE_FIELDS) + ")",
+                [(analysis_id, roof["index"]) + tuple(roof.get(f) for f in PLANE_FIELDS)
+                 for roof in stats.get("roofs", [])]
+            )
+        return analysis_id
+
+    def expire_models(self, keep):
+        """
+        Drop the model_file reference of every analysis except the newest
+        `keep` that still have one. Returns the file names to delete.
+        """
+        with self._conn() as conn, conn:
+            rows = conn.execute(
+                "SELECT id, model_file FROM analyses WHERE model_file IS NOT NULL"
+                " ORDER BY id DESC LIMIT -1 OFFSET ?", (keep,)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE analyses SET model_file = NULL WHERE id = ?", [(row["id"],) for row in rows]
+            )
+        return [row["model_file"] for row in rows]
+
+    # --------------------------
+    # Reads
+    # --------------------------
+    def get(self, analysis_id):
+        """Stats dict for one analysis (same shape /api/analyze returns), or None."""
+        with self._conn() as conn:
+            row = conn.execute("SELECT * FROM analyses WHERE id = ?", (analysis_id,)).fetchone()
+            if row is None:
+                return None
+            planes = conn.execute(
+                "SELECT * FROM planes WHERE analysis_id = ? ORDER BY plane_index", (analysis_id,)
+            ).fetchall()
+        return self._to_stats(row, planes)
+
+    def latest_id(self):
+        with self._conn() as conn:
+            return conn.execute("SELECT MAX(id) FROM analyses").fetchone()[0]
+
+    def nearby(self, lat, lon, radius_m, limit=50):
+        """Analyses within radius_m of (lat, lon), nearest first."""
+        dlat = radius_m / METERS_PER_DEG_LAT
+        dlon = radius_m / (METERS_PER_DEG_LAT * max(math.cos(math.radians(lat)), 1e-6))
+        with self._conn() as conn:
+            rows = conn.execute(
+                "SELECT a.id, a.created_at, a.lat, a.lon, a.roof_count, a.model_file"
+                " FROM analyses_rtree r JOIN analyses a ON a.id = r.id"
+                " WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?",
+                (lat - dlat, lat + dlat, lon - dlon, lon + dlon)
+            ).fetchall()
+
+        results = []
+        for row in rows:
+            distance = haversine_m(lat, lon, row["lat"], row["lon"])
+            if distance <= radius_m:
+                item = dict(row)
+                item["distance_m"] = round(distance, 2)
+                results.append(item)
+        results.sort(key=lambda r: r["distance_m"])
+        return results[:limit]
+
+    @staticmethod
+    def _to_stats(row, planes):
+        roofs = []
+        for p in planes:
+            roof = {"index": p["plane_index"]}
+            roof.update({f: p[f] for f in PLANE_FIELDS})
+            roof["is_flat"] = bool(roof["is_flat"])
+            roofs.append(roof)
+        return {
+            "analysis_id": row["id"],
+            "created_at": row["created_at"],
+            "model_file": row["model_file"],
+            "total_parts": row["total_parts"],
+            "roof_count": row["roof_count"],
+            "roofs": roofs,
+            "snap_diag": {
+                "points": row["snap_points"],
+                "clusters": row["snap_clusters"],
+                "merged": row["snap_merged"],
+            },
+            "location": {"lat": row["lat"], "lon": row["lon"], "height": row["height"]},
+        }
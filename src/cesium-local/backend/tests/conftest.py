@@ -0,0 +1,78 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pvlib
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BACKEND_DIR, "..", "..", "solar_data_inputs")
+sys.path.insert(0, BACKEND_DIR)
+
+# Site of the bundled NASA POWER data (Chonburi, Thailand, UTC+7)
+DATA_LAT = 13.1459
+DATA_LON = 100.9471
+
+def pytest_configure(config):
+    # server.py opens its store at import; keep that out of the source tree
+    config._scratch_dir = tempfile.mkdtemp(prefix="roof-tests-")
+    os.environ["ANALYSES_DB"] = os.path.join(config._scratch_dir, "analyses.db")
+    os.environ["STATIC_DIR"] = os.path.join(config._scratch_dir, "static")
+
+def pytest_unconfigure(config):
+    shutil.rmtree(config._scratch_dir, ignore_errors=True)
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """server module wired to an empty per-test store and static dir."""
+    server = pytest.importorskip("server")
+    from store import AnalysisStore
+
+    store = AnalysisStore(str(tmp_path / "analyses.db"))
+    monkeypatch.setattr(server, "store", store)
+    monkeypatch.setattr(server, "STATIC_DIR", str(tmp_path))
+    yield server
+    store.close()
+
+@pytest.fixture
+def client(server):
+    return server.app.test_client()
+
+def read_column(name):
+    series = pd.read_csv(os.path.join(DATA_DIR, f"{name}.csv"), index_col=0).iloc[:, 0]
+    series = pd.to_numeric(series, errors="coerce")
+    series.index = pd.to_datetime(series.index, utc=True)
+    return series[~series.index.duplicated()]
+
+@pytest.fixture(scope="session")
+def sky():
+    """solar.compute_sky equivalent built from src/solar_data_inputs."""
+    columns = {
+        name: read_column(name)
+        for name in ("GHI", "DNI", "DHI", "temp_air", "pressure_pa",
+                     "solar_zenith", "solar_azimuth")
+    }
+    frame = pd.DataFrame(columns).sort_index()
+    times = frame.index
+    zenith = frame["solar_zenith"].to_numpy()
+    return {
+        "ghi": frame["GHI"].fillna(0.0).to_numpy(),
+        "dni": frame["DNI"].fillna(0.0).to_numpy(),
+        "dhi": frame["DHI"].fillna(0.0).to_numpy(),
+        "temp_air": frame["temp_air"].to_numpy(),
+        "pressure_pa": frame["pressure_pa"].to_numpy(),
+        "wind_speed": np.full(len(frame), 1.0),
+        "lat": DATA_LAT,
+        "lon": DATA_LON,
+        "utc_offset": 7,
+        "epoch": times.tz_localize(None).to_numpy().astype("datetime64[s]").astype(np.int64),
+        "solar_zenith": zenith,
+        "solar_azimuth": frame["solar_azimuth"].to_numpy(),
+        "airmass": np.asarray(
+            pvlib.atmosphere.get_relative_airmass(zenith, model="kastenyoung1989"), dtype=float
+        ),
+        "dni_extra": np.asarray(pvlib.irradiance.get_extra_radiation(times), dtype=float),
+    }
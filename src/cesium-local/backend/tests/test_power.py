@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from power import ETA_INV_NOM, simulate_power
+from solar import plane_poa
+
+EAST_WEST = [
+    {"index": 1, "tilt": 30.0, "azimuth": 90.0, "panel_area": 20.0},
+    {"index": 2, "tilt": 30.0, "azimuth": 270.0, "panel_area": 20.0},
+]
+FLAT = [{"index": 1, "tilt": 2.0, "azimuth": None, "panel_area": 50.0}]
+
+def test_poa_matches_plane_poa(sky):
+    result = simulate_power(sky, [EAST_WEST])
+    for roof, poa in zip(EAST_WEST, result["poa_w"]):
+        np.testing.assert_allclose(poa, plane_poa(sky, roof["tilt"], roof["azimuth"]), rtol=1e-6, atol=1e-6)
+
+def test_ac_never_exceeds_rating_and_clipping_is_counted(sky):
+    result = simulate_power(sky, [EAST_WEST], inverter_maps=[[0, 1]], dc_ac_ratio=2.0)
+    ac, rating = result["ac_w"], result["ac_rating_w"]
+    assert ac.shape == (2, len(sky["epoch"]))
+    assert np.all(ac <= rating[:, None] + 1e-9)
+    assert np.all(ac >= 0)
+
+    # independent PVWatts efficiency curve without the clip
+    pdc0 = rating / ETA_INV_NOM
+    inverter_dc = result["dc_w"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        zeta = inverter_dc / pdc0[:, None]
+        eta = ETA_INV_NOM / 0.9637 * (-0.0162 * zeta - 0.0059 / zeta + 0.9858)
+        unclipped = np.where(inverter_dc > 0, eta * inverter_dc, 0.0)
+    expected = np.count_nonzero(unclipped >= rating[:, None], axis=1)
+    assert np.all(expected > 0)
+    np.testing.assert_array_equal(result["clipped_hours"], expected)
+
+def test_batch_matches_single_buildings(sky):
+    batch = simulate_power(sky, [EAST_WEST, FLAT])
+    for b, building in enumerate([EAST_WEST, FLAT]):
+        single = simulate_power(sky, [building])
+        np.testing.assert_allclose(batch["building_ac_kwh"][b], single["building_ac_kwh"][0])
+    assert batch["building_ac_kwh"].shape == (2, len(sky["epoch"]))
+
+@pytest.mark.parametrize("inverter_map", [[0, 5, 1, 1], [1, 1]])
+def test_inverter_numbers_must_not_skip(sky, inverter_map):
+    roofs = [dict(EAST_WEST[0], index=i) for i in range(len(inverter_map))]
+    with pytest.raises(ValueError, match="without gaps"):
+        simulate_power(sky, [roofs], inverter_maps=[inverter_map])
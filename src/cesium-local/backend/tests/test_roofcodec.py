@@ -0,0 +1,109 @@
+import gzip
+import json
+import random
+import struct
+
+import numpy as np
+import pytest
+
+from roofcodec import (
+    ROOFS_HEADER, ROOFS_MIME, STATS_MIME, decode_roofs, decode_stats, encode_roofs, encode_stats
+)
+
+ROOFS = [
+    [[1.0, 2.0, 3.0], [4.0, 5.0, 6.0], [7.0, 8.0, 9.5]],
+    [],
+    [[-1e6, 6.3e6, 1.4e6], [-1e6 + 1, 6.3e6, 1.4e6], [-1e6, 6.3e6 + 1, 1.4e6], [-1e6, 6.3e6, 1.4e6 + 1]],
+]
+
+STATS = {
+    "total_parts": 3,
+    "roof_count": 2,
+    "roofs": [
+        {"index": 0, "tilt": 22.5, "azimuth": 181.25, "color_name": "red", "is_flat": False,
+         "panel_width": 4.5, "panel_height": 6.0, "panel_area": 27.0},
+        {"index": 1, "tilt": 0.0, "azimuth": 0.0, "color_name": "blue", "is_flat": True,
+         "panel_width": None, "panel_height": None, "panel_area": None},
+    ],
+    "snap_diag": {"points": 12, "clusters": 4, "merged": 8},
+    "location": {"lat": 13.1459, "lon": 100.9471, "height": 12.5},
+}
+
+def test_roofs_round_trip_with_empty_roof():
+    decoded = decode_roofs(encode_roofs(ROOFS))
+    assert len(decoded) == len(ROOFS)
+    for roof, arr in zip(ROOFS, decoded):
+        assert arr.shape == (len(roof), 3)
+        np.testing.assert_array_equal(arr, np.asarray(roof, dtype=float).reshape(-1, 3))
+
+def test_decoded_roofs_share_the_request_buffer():
+    body = encode_roofs(ROOFS)
+    decoded = decode_roofs(body)
+    assert not decoded[0].flags.owndata
+    assert not decoded[0].flags.writeable
+
+@pytest.mark.parametrize("body", [
+    b"",
+    b"ROOF",
+    encode_roofs(ROOFS)[:-1],
+    encode_roofs(ROOFS) + b"\0" * 8,
+    b"RUFF" + encode_roofs(ROOFS)[4:],
+    ROOFS_HEADER.pack(b"ROOF", 2, 0, 0) + struct.pack("<I", 0) + b"\0" * 4,
+], ids=["empty", "header-only", "truncated", "oversized", "bad-magic", "bad-version"])
+def test_malformed_roofs_are_rejected(body):
+    with pytest.raises(ValueError):
+        decode_roofs(body)
+
+@pytest.mark.parametrize("offsets", [[0, 3, 1, 4], [1, 2, 3, 4], [0, 1, 2, 3]],
+                         ids=["non-monotonic", "first-not-zero", "last-not-n_vertices"])
+def test_bad_offsets_are_rejected(offsets):
+    head = ROOFS_HEADER.pack(b"ROOF", 1, len(offsets) - 1, 4) + struct.pack(f"<{len(offsets)}I", *offsets)
+    head += b"\0" * ((-len(head)) % 8)
+    with pytest.raises(ValueError, match="offsets"):
+        decode_roofs(head + np.zeros(12).tobytes())
+
+def test_stats_round_trip():
+    analysis_id, model_file, stats = decode_stats(encode_stats(STATS, 42, "roof_model_abc.glb"))
+
+    assert analysis_id == 42
+    assert model_file == "roof_model_abc.glb"
+    assert stats["total_parts"] == 3
+    assert stats["roof_count"] == 2
+    assert stats["snap_diag"] == STATS["snap_diag"]
+    assert stats["location"] == STATS["location"]
+    for got, want in zip(stats["roofs"], STATS["roofs"]):
+        assert got == {k: v for k, v in want.items() if k != "color_name"}
+
+def test_compact_response_honours_gzip_refusal(server):
+    payload = {"values": list(range(1000))}
+    for header, gzipped in [("gzip", True), ("gzip;q=0", False), ("identity", False), ("", False)]:
+        with server.app.test_request_context(headers={"Accept-Encoding": header}):
+            response = server.compact_response(payload)
+        assert (response.headers.get("Content-Encoding") == "gzip") == gzipped, header
+        body = response.get_data()
+        assert json.loads(gzip.decompress(body) if gzipped else body) == payload
+
+def test_binary_and_json_analyze_agree(client, server, monkeypatch):
+    pytest.importorskip("networkx")  # trimesh needs it to solidify roofs
+    from loadtest import synthetic_payload
+
+    # the full panel-layout search takes ~30 s per plane; a coarse grid is enough here
+    search = server.find_max_inscribed_rectangle
+    monkeypatch.setattr(server, "find_max_inscribed_rectangle",
+                        lambda polygon: search(polygon, num_angles=4, num_samples=4))
+    payload = synthetic_payload(random.Random(0))
+    as_json = client.post("/api/analyze", json=payload)
+    as_binary = client.post("/api/analyze", data=encode_roofs(payload["roofs"]), content_type=ROOFS_MIME)
+    assert as_json.status_code == as_binary.status_code == 200
+    assert as_binary.get_json()["stats"] == as_json.get_json()["stats"]
+
+    packed = client.post("/api/analyze", data=encode_roofs(payload["roofs"]), content_type=ROOFS_MIME,
+                         headers={"Accept": STATS_MIME})
+    assert packed.mimetype == STATS_MIME
+    _, model_file, stats = decode_stats(packed.get_data())
+    assert model_file.endswith(".glb")
+    assert stats["roof_count"] == as_json.get_json()["stats"]["roof_count"]
+
+def test_malformed_binary_analyze_is_rejected(client):
+    response = client.post("/api/analyze", data=encode_roofs(ROOFS)[:-1], content_type=ROOFS_MIME)
+    assert response.status_code == 400
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+import requests
+
+def save_analysis(server, lat, lon, roofs=()):
+    return server.store.save({"location": {"lat": lat, "lon": lon}, "roofs": list(roofs)}, None)
+
+@pytest.mark.parametrize("path", ["/api/roof-info", "/api/timeseries", "/api/orientation", "/api/power"])
+def test_malformed_id_is_rejected(client, path):
+    response = client.get(f"{path}?id=abc")
+    assert response.status_code == 400
+    assert "abc" in response.get_json()["error"]
+
+def test_unknown_id_is_not_found(client):
+    response = client.get("/api/roof-info?id=1")
+    assert response.status_code == 404
+    assert "1" in response.get_json()["error"]
+
+def test_empty_store_has_no_latest(client):
+    response = client.get("/api/roof-info")
+    assert response.status_code == 404
+
+def test_malformed_plane_is_rejected(client, server):
+    analysis_id = save_analysis(server, 13.1, 100.9)
+    response = client.get(f"/api/timeseries?id={analysis_id}&plane=abc")
+    assert response.status_code == 400
+    assert "abc" in response.get_json()["error"]
+
+@pytest.mark.parametrize("body", [
+    {"lat": 13.1, "lon": 100.9, "planes": [[float("nan"), 10]]},
+    {"lat": 13.1, "lon": 100.9, "planes": [[30, float("inf")]]},
+    {"lat": float("nan"), "lon": 100.9, "planes": [[30, 180]]},
+])
+def test_orientation_lookup_rejects_non_finite(client, body):
+    response = client.post("/api/orientation/lookup", data=json.dumps(body),
+                           content_type="application/json")
+    assert response.status_code == 400
+
+def test_power_rejects_inverter_gaps(client, server, sky, monkeypatch):
+    import solar
+    monkeypatch.setattr(solar, "compute_sky", lambda lat, lon, year: sky)
+    roofs = [{"index": i, "tilt": 30.0, "azimuth": 180.0, "panel_area": 20.0} for i in range(4)]
+    analysis_id = save_analysis(server, 1.23, 4.56, roofs)
+
+    response = client.get(f"/api/power?id={analysis_id}&inverters=0,5,1,1&agg=monthly")
+    assert response.status_code == 400
+    assert "gaps" in response.get_json()["error"]
+
+    response = client.get(f"/api/power?id={analysis_id}&inverters=0,2,1,1&agg=monthly")
+    assert response.status_code == 200
+    assert [inv["ac_rating_kw"] > 0 for inv in response.get_json()["inverters"]] == [True] * 3
+
+@pytest.mark.parametrize("path", ["/api/timeseries", "/api/orientation", "/api/power"])
+def test_weather_outage_is_bad_gateway(client, server, monkeypatch, path):
+    import solar
+
+    def unreachable(lat, lon, year):
+        raise requests.ConnectionError("NASA POWER unreachable")
+
+    monkeypatch.setattr(solar, "compute_sky", unreachable)
+    analysis_id = save_analysis(server, -45.67, 12.34, [{"index": 0, "tilt": 30.0, "azimuth": 180.0}])
+    response = client.get(f"{path}?id={analysis_id}")
+    assert response.status_code == 502
+    assert "unreachable" in response.get_json()["error"]
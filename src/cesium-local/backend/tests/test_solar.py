@@ -0,0 +1,98 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from solar import (
+    BuildCache, aggregate, build_orientation_surface, plane_poa, poa_matrix, series_window, slice_sky,
+    surface_lookup
+)
+
+ORIENTATIONS = [(0.0, 180.0), (15.0, 180.0), (30.0, 90.0), (30.0, 270.0), (60.0, 0.0), (90.0, 135.0)]
+
+def test_sky_fixture_is_one_year(sky):
+    assert len(sky["epoch"]) == 8760
+    assert np.all(np.diff(sky["epoch"]) == 3600)
+
+def test_poa_matrix_matches_plane_poa(sky):
+    tilts, azimuths = np.array(ORIENTATIONS).T
+    matrix = poa_matrix(sky, tilts, azimuths)
+    for row, (tilt, azimuth) in zip(matrix, ORIENTATIONS):
+        expected = plane_poa(sky, tilt, azimuth)
+        np.testing.assert_allclose(row, expected, rtol=1e-6, atol=1e-6)
+
+def test_surface_matches_plane_poa(sky):
+    surface = build_orientation_surface(sky)
+    for tilt, azimuth in ORIENTATIONS:
+        expected = plane_poa(sky, tilt, azimuth).sum() / 1000
+        assert float(surface_lookup(surface, tilt, azimuth)) == pytest.approx(expected, rel=1e-6)
+        assert surface_lookup(surface, tilt, azimuth, field="monthly").sum() == pytest.approx(expected, rel=1e-6)
+
+def test_surface_lookup_interpolates_and_wraps(sky):
+    surface = build_orientation_surface(sky, tilts=np.arange(0.0, 91.0, 10.0),
+                                        azimuths=np.arange(0.0, 360.0, 10.0))
+    annual = surface["annual"]
+    mid = surface_lookup(surface, 15.0, 355.0)
+    corners = annual[1:3][:, [35, 0]]
+    assert float(mid) == pytest.approx(corners.mean())
+    np.testing.assert_allclose(
+        surface_lookup(surface, [20.0, 20.0], [-10.0, 350.0]), [annual[2, 35]] * 2
+    )
+
+def test_series_window_daily_buckets(sky):
+    i0, i1, starts, bucket_epoch = series_window(sky, "daily", "2023-03-01", "2023-03-03")
+    assert i1 - i0 == 72
+    assert len(starts) == 3
+    assert np.all(np.diff(bucket_epoch) == 86400)
+
+def test_sliced_sky_matches_full_year_window(sky):
+    i0, i1, starts, _ = series_window(sky, "daily", "2023-06-10", "2023-06-20")
+    window_sky = slice_sky(sky, i0, i1)
+    assert len(window_sky["epoch"]) == i1 - i0
+    assert window_sky["lat"] == sky["lat"]
+
+    for tilt, azimuth in ORIENTATIONS:
+        full = aggregate(plane_poa(sky, tilt, azimuth), i0, i1, starts)
+        sliced = aggregate(plane_poa(window_sky, tilt, azimuth), 0, i1 - i0, starts)
+        np.testing.assert_allclose(sliced, full, rtol=1e-9)
+
+def test_build_cache_evicts_least_recently_used():
+    cache = BuildCache(2)
+    cache.get("a", lambda: 1)
+    cache.get("b", lambda: 2)
+    cache.get("a", lambda: pytest.fail("a should be cached"))
+    cache.get("c", lambda: 3)
+
+    assert len(cache) == 2
+    assert cache.get("a", lambda: pytest.fail("a should be cached")) == 1
+    assert cache.get("b", lambda: 20) == 20
+
+def test_build_cache_shares_concurrent_builds():
+    cache = BuildCache(4)
+    calls = []
+
+    def build():
+        calls.append(1)
+        time.sleep(0.05)
+        return object()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("k", build))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert all(r is results[0] for r in results)
+
+def test_build_cache_does_not_keep_failures():
+    cache = BuildCache(4)
+
+    def fail():
+        raise RuntimeError("fetch failed")
+
+    with pytest.raises(RuntimeError):
+        cache.get("k", fail)
+    assert cache.get("k", lambda: 5) == 5
@@ -0,0 +1,73 @@
+import threading
+
+import pytest
+
+from store import AnalysisStore
+
+def make_stats(lat, lon, roofs=1):
+    return {
+        "location": {"lat": lat, "lon": lon, "height": 10.0},
+        "total_parts": roofs,
+        "roof_count": roofs,
+        "snap_diag": {"points": 0, "clusters": 0, "merged": 0},
+        "roofs": [
+            {"index": i, "tilt": 20.0, "azimuth": 180.0, "color_name": "red", "is_flat": False,
+             "panel_width": 4.0, "panel_height": 5.0, "panel_area": 20.0}
+            for i in range(roofs)
+        ],
+    }
+
+@pytest.fixture
+def store(tmp_path):
+    store = AnalysisStore(str(tmp_path / "analyses.db"), pool_size=2)
+    yield store
+    store.close()
+
+def test_save_and_get_round_trip(store):
+    analysis_id = store.save(make_stats(13.1, 100.9, roofs=3), "a.glb")
+    stats = store.get(analysis_id)
+
+    assert store.latest_id() == analysis_id
+    assert stats["model_file"] == "a.glb"
+    assert [roof["index"] for roof in stats["roofs"]] == [0, 1, 2]
+    assert stats["roofs"][0]["is_flat"] is False
+    assert store.get(analysis_id + 1) is None
+
+def test_wal_mode(store):
+    with store._conn() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+def test_concurrent_writers_share_pool(store):
+    errors = []
+
+    def worker(n):
+        try:
+            for _ in range(10):
+                store.save(make_stats(13.1 + n * 1e-3, 100.9), f"{n}.glb")
+                store.nearby(13.1, 100.9, 5000)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert store.latest_id() == 80
+    assert store._pool.qsize() <= 2
+
+def test_nearby_filters_by_distance(store):
+    near = store.save(make_stats(13.1, 100.9), "near.glb")
+    store.save(make_stats(13.2, 100.9), "far.glb")
+
+    results = store.nearby(13.1001, 100.9, 100)
+    assert [r["id"] for r in results] == [near]
+
+def test_expire_models_keeps_newest(store):
+    ids = [store.save(make_stats(13.1, 100.9), f"{n}.glb") for n in range(5)]
+
+    assert sorted(store.expire_models(2)) == ["0.glb", "1.glb", "2.glb"]
+    assert store.expire_models(2) == []
+    assert [store.get(i)["model_file"] for i in ids] == [None, None, None, "3.glb", "4.glb"]